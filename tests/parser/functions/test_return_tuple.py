@@ -155,3 +155,49 @@ def getTimeAndBalance() -> (bool, address):
     """
 
     assert_tx_failed(lambda: get_contract_with_gas_estimation(code), TypeMismatchException)
+
+
+def test_private_tuple_return_passthrough(get_contract_with_gas_estimation):
+    code = """
+@private
+def _inner(a: uint256) -> (uint256, int128, uint256):
+    return a, -2, a + 3
+
+@private
+def _outer(a: uint256) -> (uint256, int128, uint256):
+    return self._inner(a)
+
+@public
+def foo(a: uint256) -> (uint256, int128, uint256):
+    return self._outer(a)
+    """
+
+    c = get_contract_with_gas_estimation(code)
+    assert c.foo(7) == [7, -2, 10]
+
+
+def test_private_static_tuple_return(get_contract_with_gas_estimation):
+    code = """
+@private
+def _short(a: uint256) -> (uint256, int128, uint256):
+    b: uint256 = a + 1
+    return a, -2, b
+
+@private
+def _long(a: uint256) -> (uint256, uint256, uint256, uint256, uint256,
+                          uint256, uint256, uint256, uint256):
+    return a, a + 1, a + 2, a + 3, a + 4, a + 5, a + 6, a + 7, a + 8
+
+@public
+def short(a: uint256) -> (uint256, int128, uint256):
+    return self._short(a)
+
+@public
+def long(a: uint256) -> (uint256, uint256, uint256, uint256, uint256,
+                         uint256, uint256, uint256, uint256):
+    return self._long(a)
+    """
+
+    c = get_contract_with_gas_estimation(code)
+    assert c.short(7) == [7, -2, 8]
+    assert c.long(7) == list(range(7, 16))
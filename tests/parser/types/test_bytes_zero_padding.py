@@ -1,6 +1,10 @@
 import hypothesis
 import pytest
 
+from vyper.compiler import (
+    compile_code,
+)
+
 
 @pytest.fixture(scope='module')
 def little_endian_contract(get_contract_module):
@@ -38,3 +42,29 @@ def test_zero_pad_range(little_endian_contract, value):
     actual_bytes = value.to_bytes(8, byteorder="little")
     contract_bytes = little_endian_contract.get_count(value)
     assert contract_bytes == actual_bytes
+
+
+def test_zero_pad_literal():
+    code = """
+@public
+def short() -> bytes[40]:
+    return b"abc"
+
+@public
+def exact() -> bytes[40]:
+    return b"0123456789abcdef0123456789abcdef"
+    """
+    lll = compile_code(code, ['ir'])['ir']
+
+    def find_calldatacopies(_list):
+        if not isinstance(_list, list):
+            return []
+        found = [_list] if _list and _list[0] == 'calldatacopy' else []
+        for i in _list:
+            found += find_calldatacopies(i)
+        return found
+
+    # Only the short literal is padded, with a constant number of zero bytes
+    copies = find_calldatacopies(lll.to_list())
+    assert len(copies) == 1
+    assert copies[0][2:] == [['calldatasize'], [29]]
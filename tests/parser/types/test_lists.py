@@ -268,3 +268,27 @@ def parse_list_fail():
             lambda: get_contract_with_gas_estimation(code),
             TypeMismatchException
             )
+
+
+def test_list_copy_between_locations(get_contract_with_gas_estimation):
+    code = """
+s: uint256[5]
+d: address[3]
+
+@public
+def copy_roundtrip(x: uint256[5]) -> uint256[5]:
+    self.s = x
+    y: uint256[5] = self.s
+    z: uint256[5] = y
+    return z
+
+@public
+def copy_addresses(x: address[3]) -> address[3]:
+    self.d = x
+    return self.d
+    """
+
+    c = get_contract_with_gas_estimation(code)
+    assert c.copy_roundtrip([1, 2, 3, 4, 5]) == [1, 2, 3, 4, 5]
+    addrs = ["0x" + str(i) * 40 for i in range(1, 4)]
+    assert c.copy_addresses(addrs) == addrs
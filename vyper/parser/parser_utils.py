@@ -1,8 +1,10 @@
 import ast as python_ast
+import re
 from typing import (
     Any,
     List,
     Optional,
+    Tuple,
     Union,
 )
 
@@ -48,50 +50,66 @@ from vyper.utils import (
     SizeLimits,
 )
 
+DECIMAL_RE = re.compile(r'[0-9.]*')
+HEX_RE = re.compile(r'[0-9a-fA-F]*')
+BINARY_RE = re.compile(r'[01]*')
+
+
+# Get the original source code split into lines, caching the result on the context
+def _get_source_lines(context):
+    lines = getattr(context, '_origcode_lines', None)
+    if lines is None:
+        lines = context.origcode.splitlines()
+        context._origcode_lines = lines
+    return lines
+
 
 # Get a decimal number as a fraction with denominator multiple of 10
 def get_number_as_fraction(expr, context):
-    context_slice = context.origcode.splitlines()[expr.lineno - 1][expr.col_offset:]
-    t = 0
-    while t < len(context_slice) and context_slice[t] in '0123456789.':
-        t += 1
+    context_slice = _get_source_lines(context)[expr.lineno - 1][expr.col_offset:]
+    t = DECIMAL_RE.match(context_slice).end()
     if t < len(context_slice) and context_slice[t] == 'e':
         raise InvalidLiteralException("Literals in scientific notation not accepted.")
-    top = int(context_slice[:t].replace('.', ''))
-    bottom = 1 if '.' not in context_slice[:t] else 10**(t - context_slice[:t].index('.') - 1)
+    literal = context_slice[:t]
+    dot = literal.find('.')
+    top = int(literal if dot < 0 else literal.replace('.', '', 1))
+    bottom = 1 if dot < 0 else 10**(t - dot - 1)
 
     if expr.n < 0:
         top *= -1
 
-    return context_slice[:t], top, bottom
+    return literal, top, bottom
 
 
 # Is a number of decimal form (e.g. 65281) or 0x form (e.g. 0xff01) or 0b binary form (e.g. 0b0001)
 def get_original_if_0_prefixed(expr, context):
-    context_slice = context.origcode.splitlines()[expr.lineno - 1][expr.col_offset:]
+    context_slice = _get_source_lines(context)[expr.lineno - 1][expr.col_offset:]
     type_prefix = context_slice[:2]
 
     if type_prefix not in ('0x', '0b'):
         return None
 
     if type_prefix == '0x':
-        t = 0
-        while t + 2 < len(context_slice) and context_slice[t + 2] in '0123456789abcdefABCDEF':
-            t += 1
-        return context_slice[:t + 2]
+        return context_slice[:HEX_RE.match(context_slice, 2).end()]
     elif type_prefix == '0b':
-        t = 0
-        while t + 2 < len(context_slice) and context_slice[t + 2] in '01':
-            t += 1
-        return context_slice[:t + 2]
+        return context_slice[:BINARY_RE.match(context_slice, 2).end()]
+
+
+# Static parts of the memory to memory byte array copy, shared between copiers.
+# LLLnode computes gas and valency from its args on construction, so only the
+# leaves that never change are prebuilt; the nodes around source and destination
+# are still constructed per copy.
+_MEMORY_COPY_SIZE = LLLnode.from_list(['add', 32, ['mload', '_source']])
+_MEMORY_COPY_GAS = LLLnode.from_list(['add', 18, ['div', '_sz', 10]])
 
 
 # Copies byte array
 def make_byte_array_copier(destination, source, pos=None):
-    if not isinstance(source.typ, (ByteArrayLike, NullType)):
+    source_is_null = isinstance(source.typ, NullType)
+    if not source_is_null and not isinstance(source.typ, ByteArrayLike):
         btype = 'byte array' if isinstance(destination.typ, ByteArrayType) else 'string'
         raise TypeMismatchException(f"Can only set a {btype} to another {btype}", pos)
-    if isinstance(source.typ, ByteArrayLike) and source.typ.maxlen > destination.typ.maxlen:
+    if not source_is_null and source.typ.maxlen > destination.typ.maxlen:
         raise TypeMismatchException(
             f"Cannot cast from greater max-length {source.typ.maxlen} to shorter "
             f"max-length {destination.typ.maxlen}"
@@ -99,17 +117,30 @@ def make_byte_array_copier(destination, source, pos=None):
     # Special case: memory to memory
     if source.location == "memory" and destination.location == "memory":
         gas_calculation = GAS_IDENTITY + GAS_IDENTITYWORD * (ceil32(source.typ.maxlen) // 32)
-        o = LLLnode.from_list([
-            'with', '_source', source, [
-                'with', '_sz', ['add', 32, ['mload', '_source']], [
-                    'assert', ['call', ['add', 18, ['div', '_sz', 10]], 4, 0, '_source', '_sz', destination, '_sz']]]],  # noqa: E501
-            typ=None, add_gas_estimate=gas_calculation, annotation='Memory copy'
+        call = LLLnode('call', [
+            _MEMORY_COPY_GAS,
+            LLLnode(4),
+            LLLnode(0),
+            LLLnode('_source'),
+            LLLnode('_sz'),
+            destination,
+            LLLnode('_sz'),
+        ])
+        copier = LLLnode('with', [
+            LLLnode('_sz'),
+            _MEMORY_COPY_SIZE,
+            LLLnode('assert', [call]),
+        ])
+        return LLLnode(
+            'with',
+            [LLLnode('_source'), source, copier],
+            add_gas_estimate=gas_calculation,
+            annotation='Memory copy',
         )
-        return o
 
     pos_node = LLLnode.from_list('_pos', typ=source.typ, location=source.location)
     # Get the length
-    if isinstance(source.typ, NullType):
+    if source_is_null:
         length = 1
     elif source.location == "memory":
         length = ['add', ['mload', '_pos'], 32]
@@ -129,12 +160,12 @@ def make_byte_array_copier(destination, source, pos=None):
             location=destination.location,
         )
     # Maximum theoretical length
-    max_length = 32 if isinstance(source.typ, NullType) else source.typ.maxlen + 32
-    return LLLnode.from_list([
-        'with', '_pos',
-        0 if isinstance(source.typ, NullType) else source,
-        make_byte_slice_copier(destination, pos_node, length, max_length, pos=pos)
-    ], typ=None)
+    max_length = 32 if source_is_null else source.typ.maxlen + 32
+    return LLLnode('with', [
+        LLLnode('_pos'),
+        LLLnode(0) if source_is_null else source,
+        make_byte_slice_copier(destination, pos_node, length, max_length, pos=pos),
+    ])
 
 
 # Copy bytes
@@ -146,39 +177,41 @@ def make_byte_array_copier(destination, source, pos=None):
 def make_byte_slice_copier(destination, source, length, max_length, pos=None):
     # Special case: memory to memory
     if source.location == "memory" and destination.location == "memory":
-        return LLLnode.from_list([
-            'with', '_l', max_length,
-            [
-                'pop',
-                ['call', 18 + max_length // 10, 4, 0, source, '_l', destination, '_l']
-            ]
-        ], typ=None, annotation=f'copy byte slice dest: {str(destination)}')
+        # Static template, so build the nodes directly rather than via from_list
+        call = LLLnode('call', [
+            LLLnode(18 + max_length // 10),
+            LLLnode(4),
+            LLLnode(0),
+            source,
+            LLLnode('_l'),
+            destination,
+            LLLnode('_l'),
+        ])
+        return LLLnode(
+            'with',
+            [LLLnode('_l'), LLLnode(max_length), LLLnode('pop', [call])],
+            annotation=f'copy byte slice dest: {str(destination)}',
+        )
+    # Loop index, shared by the loader, setter and checker below
+    index = LLLnode.from_list(['mload', MemoryPositions.FREE_LOOP_INDEX], pos=pos)
     # Copy over data
     if isinstance(source.typ, NullType):
         loader = 0
     elif source.location == "memory":
-        loader = ['mload', ['add', '_pos', ['mul', 32, ['mload', MemoryPositions.FREE_LOOP_INDEX]]]]
+        loader = ['mload', ['add', '_pos', ['mul', 32, index]]]
     elif source.location == "storage":
-        loader = ['sload', ['add', '_pos', ['mload', MemoryPositions.FREE_LOOP_INDEX]]]
+        loader = ['sload', ['add', '_pos', index]]
     else:
         raise Exception("Unsupported location:" + source.location)
     # Where to paste it?
     if destination.location == "memory":
-        setter = [
-            'mstore',
-            ['add', '_opos', ['mul', 32, ['mload', MemoryPositions.FREE_LOOP_INDEX]]],
-            loader
-        ]
+        setter = ['mstore', ['add', '_opos', ['mul', 32, index]], loader]
     elif destination.location == "storage":
-        setter = ['sstore', ['add', '_opos', ['mload', MemoryPositions.FREE_LOOP_INDEX]], loader]
+        setter = ['sstore', ['add', '_opos', index], loader]
     else:
         raise Exception("Unsupported location:" + destination.location)
     # Check to see if we hit the length
-    checker = [
-        'if',
-        ['gt', ['mul', 32, ['mload', MemoryPositions.FREE_LOOP_INDEX]], '_actual_len'],
-        'break'
-    ]
+    checker = ['if', ['gt', ['mul', 32, index], '_actual_len'], 'break']
     # Make a loop to do the copying
     o = [
         'with', '_pos', source, [
@@ -248,6 +281,69 @@ def getpos(node):
     )
 
 
+# Get the memory offset of each member of a tuple-like type, caching the result on the type
+def _get_member_offsets(typ):
+    offsets = getattr(typ, '_member_offsets', None)
+    if offsets is None:
+        offsets = []
+        offset = 0
+        for member_typ in typ.tuple_members():
+            offsets.append(offset)
+            offset += 32 * get_size_of_type(member_typ)
+        typ._member_offsets = offsets
+    return offsets
+
+
+# Get the offset of each member within the head of a returned tuple, where byte
+# arrays are stored as a 32 byte pointer, caching the result on the type
+def _get_tuple_head_offsets(typ):
+    offsets = getattr(typ, '_head_offsets', None)
+    if offsets is None:
+        offsets = []
+        offset = 0
+        for member_typ in typ.members:
+            offsets.append(offset)
+            if isinstance(member_typ, ByteArrayLike):
+                offset += 32
+            else:
+                offset += 32 * get_size_of_type(member_typ)
+        typ._head_offsets = offsets
+    return offsets
+
+
+# Get the position of each member of a struct type by name, caching the result on the type
+def _get_member_index(typ):
+    member_index = getattr(typ, '_member_index', None)
+    if member_index is None:
+        member_index = {key: i for i, key in enumerate(typ.tuple_keys())}
+        typ._member_index = member_index
+    return member_index
+
+
+# Descend into an element of a list, given an index that is already checked
+# (or known) to be in bounds. Used by add_variable_offset, and directly by
+# make_setter to skip re-dispatching on the type and key for every element.
+def _list_element(token, index, pos):
+    subtype = token.typ.subtype
+    if token.location == 'storage':
+        return LLLnode.from_list(['add', ['sha3_32', token], index],
+                                 typ=subtype,
+                                 location='storage')
+    elif token.location == 'storage_prehashed':
+        return LLLnode.from_list(['add', token, index],
+                                 typ=subtype,
+                                 location='storage')
+    elif token.location in ('calldata', 'memory'):
+        offset = 32 * get_size_of_type(subtype)
+        return LLLnode.from_list(
+            ['add', ['mul', offset, index], token],
+            typ=subtype,
+            location=token.location,
+        )
+    else:
+        raise TypeMismatchException("Not expecting an array access ", pos)
+
+
 # Take a value representing a memory or storage location, and descend down to
 # an element or member variable
 def add_variable_offset(parent, key, pos, array_bounds_check=True):
@@ -261,21 +357,14 @@ def add_variable_offset(parent, key, pos, array_bounds_check=True):
             if key not in typ.members:
                 raise TypeMismatchException(f"Object does not have member variable {key}", pos)
             subtype = typ.members[key]
-            attrs = list(typ.tuple_keys())
-
-            if key not in attrs:
-                raise TypeMismatchException(
-                    f"Member {key} not found. Only the following available: " + " ".join(attrs),
-                    pos
-                )
-            index = attrs.index(key)
+            index = _get_member_index(typ)[key]
             annotation = key
         else:
             if not isinstance(key, int):
                 raise TypeMismatchException(
                     f"Expecting a static index; cannot access element {key}", pos
                 )
-            attrs = list(range(len(typ.members)))
+            subtype = typ.members[key]
             index = key
             annotation = None
         if location == 'storage':
@@ -291,11 +380,9 @@ def add_variable_offset(parent, key, pos, array_bounds_check=True):
                 location='storage',
             )
         elif location in ('calldata', 'memory'):
-            offset = 0
-            for i in range(index):
-                offset += 32 * get_size_of_type(typ.members[attrs[i]])
+            offset = _get_member_offsets(typ)[index]
             return LLLnode.from_list(['add', offset, parent],
-                                     typ=typ.members[key],
+                                     typ=subtype,
                                      location=location,
                                      annotation=annotation)
         else:
@@ -336,7 +423,6 @@ def add_variable_offset(parent, key, pos, array_bounds_check=True):
 
     elif isinstance(typ, ListType):
 
-        subtype = typ.subtype
         k = unwrap_location(key)
         if not is_base_type(key.typ, ('int128', 'uint256')):
             raise TypeMismatchException(f'Invalid type for array index: {key.typ}', pos)
@@ -358,23 +444,7 @@ def add_variable_offset(parent, key, pos, array_bounds_check=True):
             # an array index, and the clamp will throw an error.
             sub = ['uclamplt', k, typ.count]
 
-        if location == 'storage':
-            return LLLnode.from_list(['add', ['sha3_32', parent], sub],
-                                     typ=subtype,
-                                     location='storage')
-        elif location == 'storage_prehashed':
-            return LLLnode.from_list(['add', parent, sub],
-                                     typ=subtype,
-                                     location='storage')
-        elif location in ('calldata', 'memory'):
-            offset = 32 * get_size_of_type(subtype)
-            return LLLnode.from_list(
-                ['add', ['mul', offset, sub], parent],
-                typ=subtype,
-                location=location,
-            )
-        else:
-            raise TypeMismatchException("Not expecting an array access ", pos)
+        return _list_element(parent, sub, pos)
     else:
         raise TypeMismatchException(f"Cannot access the child of a constant variable! {typ}", pos)
 
@@ -382,6 +452,9 @@ def add_variable_offset(parent, key, pos, array_bounds_check=True):
 # Convert from one base type to another
 def base_type_conversion(orig, frm, to, pos, in_function_call=False):
     orig = unwrap_location(orig)
+    # Converting a non-literal to an equal type is the common case and needs no checks
+    if isinstance(frm, BaseType) and not frm.is_literal and frm == to:
+        return LLLnode(orig.value, orig.args, typ=to, add_gas_estimate=orig.add_gas_estimate)
     is_valid_int128_to_decimal = (
         is_base_type(frm, 'int128') and is_base_type(to, 'decimal')
     ) and are_units_compatible(frm, to)
@@ -425,12 +498,13 @@ def base_type_conversion(orig, frm, to, pos, in_function_call=False):
 
 # Unwrap location
 def unwrap_location(orig):
+    # orig is already an LLLnode, so build the load directly rather than via from_list
     if orig.location == 'memory':
-        return LLLnode.from_list(['mload', orig], typ=orig.typ)
+        return LLLnode('mload', [orig], typ=orig.typ)
     elif orig.location == 'storage':
-        return LLLnode.from_list(['sload', orig], typ=orig.typ)
+        return LLLnode('sload', [orig], typ=orig.typ)
     elif orig.location == 'calldata':
-        return LLLnode.from_list(['calldataload', orig], typ=orig.typ)
+        return LLLnode('calldataload', [orig], typ=orig.typ)
     else:
         return orig
 
@@ -439,7 +513,7 @@ def unwrap_location(orig):
 def pack_arguments(signature, args, context, stmt_expr, return_placeholder=True):
     pos = getpos(stmt_expr)
     placeholder_typ = ByteArrayType(
-        maxlen=sum([get_size_of_type(arg.typ) for arg in signature.args]) * 32 + 32
+        maxlen=sum(get_size_of_type(arg.typ) for arg in signature.args) * 32 + 32
     )
     placeholder = context.new_placeholder(placeholder_typ)
     setters = [['mstore', placeholder, signature.method_id]]
@@ -454,18 +528,25 @@ def pack_arguments(signature, args, context, stmt_expr, return_placeholder=True)
             stmt_expr
         )
 
-    for i, (arg, typ) in enumerate(zip(args, [arg.typ for arg in signature.args])):
+    # Arguments are packed after the 32-byte method id slot
+    args_start = placeholder + 32
+    for i, (arg, sig_arg) in enumerate(zip(args, signature.args)):
+        typ = sig_arg.typ
+        slot = args_start + staticarray_offset + i * 32
         if isinstance(typ, BaseType):
-            setters.append(make_setter(LLLnode.from_list(
-                placeholder + staticarray_offset + 32 + i * 32,
-                typ=typ,
-            ), arg, 'memory', pos=pos, in_function_call=True))
+            setters.append(make_setter(
+                LLLnode.from_list(slot, typ=typ),
+                arg,
+                'memory',
+                pos=pos,
+                in_function_call=True,
+            ))
 
         elif isinstance(typ, ByteArrayLike):
-            setters.append(['mstore', placeholder + staticarray_offset + 32 + i * 32, '_poz'])
+            setters.append(['mstore', slot, '_poz'])
             arg_copy = LLLnode.from_list('_s', typ=arg.typ, location=arg.location)
             target = LLLnode.from_list(
-                ['add', placeholder + 32, '_poz'],
+                ['add', args_start, '_poz'],
                 typ=typ,
                 location='memory',
             )
@@ -486,7 +567,7 @@ def pack_arguments(signature, args, context, stmt_expr, return_placeholder=True)
             if has_dynamic_data(typ):
                 raise TypeMismatchException("Cannot pack bytearray in struct", stmt_expr)
             target = LLLnode.from_list(
-                [placeholder + 32 + staticarray_offset + i * 32],
+                [slot],
                 typ=typ,
                 location='memory',
             )
@@ -559,7 +640,7 @@ def make_setter(left, right, location, pos, in_function_call=False):
             raise TypeMismatchException(
                 f"Setter type mismatch: left side is array, right side is {right.typ}", pos
             )
-        left_token = LLLnode.from_list('_L', typ=left.typ, location=left.location)
+        left_token = LLLnode('_L', typ=left.typ, location=left.location)
         if left.location == "storage":
             left = LLLnode.from_list(['sha3_32', left], typ=left.typ, location="storage_prehashed")
             left_token.location = "storage_prehashed"
@@ -575,41 +656,36 @@ def make_setter(left, right, location, pos, in_function_call=False):
                 raise TypeMismatchException("Mismatched number of elements", pos)
             subs = []
             for i in range(left.typ.count):
-                subs.append(make_setter(add_variable_offset(
-                    left_token,
-                    LLLnode.from_list(i, typ='int128'),
+                subs.append(make_setter(
+                    _list_element(left_token, LLLnode.from_list(i, typ='int128'), pos),
+                    right.args[i],
+                    location,
                     pos=pos,
-                    array_bounds_check=False,
-                ), right.args[i], location, pos=pos))
+                ))
             return LLLnode.from_list(['with', '_L', left, ['seq'] + subs], typ=None)
         # If the right side is a null
         # CC 20190619 probably not needed as of #1106
         elif isinstance(right.typ, NullType):
             subs = []
             for i in range(left.typ.count):
-                subs.append(make_setter(add_variable_offset(
-                    left_token,
-                    LLLnode.from_list(i, typ='int128'),
+                subs.append(make_setter(
+                    _list_element(left_token, LLLnode.from_list(i, typ='int128'), pos),
+                    LLLnode.from_list(None, typ=NullType()),
+                    location,
                     pos=pos,
-                    array_bounds_check=False,
-                ), LLLnode.from_list(None, typ=NullType()), location, pos=pos))
+                ))
             return LLLnode.from_list(['with', '_L', left, ['seq'] + subs], typ=None)
         # If the right side is a variable
         else:
-            right_token = LLLnode.from_list('_R', typ=right.typ, location=right.location)
+            right_token = LLLnode('_R', typ=right.typ, location=right.location)
             subs = []
             for i in range(left.typ.count):
-                subs.append(make_setter(add_variable_offset(
-                    left_token,
-                    LLLnode.from_list(i, typ='int128'),
-                    pos=pos,
-                    array_bounds_check=False,
-                ), add_variable_offset(
-                    right_token,
-                    LLLnode.from_list(i, typ='int128'),
+                subs.append(make_setter(
+                    _list_element(left_token, LLLnode.from_list(i, typ='int128'), pos),
+                    _list_element(right_token, LLLnode.from_list(i, typ='int128'), pos),
+                    location,
                     pos=pos,
-                    array_bounds_check=False,
-                ), location, pos=pos))
+                ))
             return LLLnode.from_list([
                 'with', '_L', left, [
                     'with', '_R', right, ['seq'] + subs]
@@ -631,18 +707,24 @@ def make_setter(left, right, location, pos, in_function_call=False):
                             'Setting struct value to None is not allowed, use a default value.',
                             pos,
                         )
-                for k in left.typ.members:
-                    if k not in right.typ.members:
-                        raise TypeMismatchException(
-                            f"Keys don't match for structs, missing {k}",
-                            pos,
-                        )
-                for k in right.typ.members:
-                    if k not in left.typ.members:
-                        raise TypeMismatchException(
-                            f"Keys don't match for structs, extra {k}",
-                            pos,
-                        )
+                # Only scan for the offending key when the key sets differ,
+                # which is never the case when assigning a struct to itself
+                if not (
+                    left.typ is right.typ
+                    or left.typ.members.keys() == right.typ.members.keys()
+                ):
+                    for k in left.typ.members:
+                        if k not in right.typ.members:
+                            raise TypeMismatchException(
+                                f"Keys don't match for structs, missing {k}",
+                                pos,
+                            )
+                    for k in right.typ.members:
+                        if k not in left.typ.members:
+                            raise TypeMismatchException(
+                                f"Keys don't match for structs, extra {k}",
+                                pos,
+                            )
                 if left.typ.name != right.typ.name:
                     raise TypeMismatchException(f"Expected {left.typ}, got {right.typ}", pos)
             else:
@@ -653,7 +735,7 @@ def make_setter(left, right, location, pos, in_function_call=False):
                         pos,
                     )
 
-        left_token = LLLnode.from_list('_L', typ=left.typ, location=left.location)
+        left_token = LLLnode('_L', typ=left.typ, location=left.location)
         if left.location == "storage":
             left = LLLnode.from_list(['sha3_32', left], typ=left.typ, location="storage_prehashed")
             left_token.location = "storage_prehashed"
@@ -696,27 +778,26 @@ def make_setter(left, right, location, pos, in_function_call=False):
         # If tuple assign.
         elif isinstance(left.typ, TupleType) and isinstance(right.typ, TupleType):
             subs = []
-            static_offset_counter = 0
-            zipped_components = zip(left.args, right.typ.members, locations)
+            zipped_components = zip(
+                left.args, right.typ.members, _get_tuple_head_offsets(right.typ), locations
+            )
             for var_arg in left.args:
                 if var_arg.location == 'calldata':
                     raise ConstancyViolationException(
                         f"Cannot modify function argument: {var_arg.annotation}", pos
                     )
-            for left_arg, right_arg, loc in zipped_components:
+            for left_arg, right_arg, static_offset, loc in zipped_components:
                 if isinstance(right_arg, ByteArrayLike):
                     RType = ByteArrayType if isinstance(right_arg, ByteArrayType) else StringType
                     offset = LLLnode.from_list(
-                        ['add', '_R', ['mload', ['add', '_R', static_offset_counter]]],
+                        ['add', '_R', ['mload', ['add', '_R', static_offset]]],
                         typ=RType(right_arg.maxlen), location='memory', pos=pos)
-                    static_offset_counter += 32
                 else:
                     offset = LLLnode.from_list(
-                        ['mload', ['add', '_R', static_offset_counter]],
+                        ['mload', ['add', '_R', static_offset]],
                         typ=right_arg.typ,
                         pos=pos,
                     )
-                    static_offset_counter += get_size_of_type(right_arg) * 32
                 subs.append(
                     make_setter(
                         left_arg,
@@ -733,7 +814,7 @@ def make_setter(left, right, location, pos, in_function_call=False):
         # If the right side is a variable
         else:
             subs = []
-            right_token = LLLnode.from_list('_R', typ=right.typ, location=right.location)
+            right_token = LLLnode('_R', typ=right.typ, location=right.location)
             for typ, loc in zip(keyz, locations):
                 subs.append(make_setter(
                     add_variable_offset(left_token, typ, pos=pos),
@@ -749,63 +830,24 @@ def make_setter(left, right, location, pos, in_function_call=False):
         raise Exception("Invalid type for setters")
 
 
+EXIT_STATEMENT_TYPES = frozenset((python_ast.Return, python_ast.Raise))
+
+
 def is_return_from_function(node: Union[python_ast.AST, List[Any]]) -> bool:
-    is_selfdestruct = (
-        isinstance(node, python_ast.Expr)
-        and isinstance(node.value, python_ast.Call)
-        and isinstance(node.value.func, python_ast.Name)
-        and node.value.func.id == 'selfdestruct'
-    )
-    if isinstance(node, python_ast.Return):
-        return True
-    elif isinstance(node, python_ast.Raise):
-        return True
-    elif is_selfdestruct:
+    if type(node) in EXIT_STATEMENT_TYPES:
         return True
+    elif isinstance(node, python_ast.Expr):
+        # selfdestruct(...) also exits the function
+        value = node.value
+        return (
+            isinstance(value, python_ast.Call)
+            and isinstance(value.func, python_ast.Name)
+            and value.func.id == 'selfdestruct'
+        )
     else:
         return False
 
 
-class AnnotatingVisitor(python_ast.NodeTransformer):
-    _source_code: str
-    _class_types: ClassTypes
-
-    def __init__(self, source_code: str, class_types: Optional[ClassTypes] = None):
-        self._source_code: str = source_code
-        self.counter: int = 0
-        if class_types is not None:
-            self._class_types = class_types
-        else:
-            self._class_types = {}
-
-    def generic_visit(self, node):
-        # Decorate every node in the AST with the original source code. This is
-        # necessary to facilitate error pretty-printing.
-        node.source_code = self._source_code
-        node.node_id = self.counter
-        self.counter += 1
-
-        return super().generic_visit(node)
-
-    def visit_ClassDef(self, node):
-        self.generic_visit(node)
-
-        # Decorate class definitions with their respective class types
-        node.class_type = self._class_types.get(node.name)
-
-        return node
-
-
-class RewriteUnarySubVisitor(python_ast.NodeTransformer):
-    def visit_UnaryOp(self, node):
-        self.generic_visit(node)
-        if isinstance(node.op, python_ast.USub) and isinstance(node.operand, python_ast.Num):
-            node.operand.n = 0 - node.operand.n
-            return node.operand
-        else:
-            return node
-
-
 class EnsureSingleExitChecker(python_ast.NodeVisitor):
 
     def visit_FunctionDef(self, node: python_ast.FunctionDef) -> None:
@@ -819,21 +861,22 @@ class EnsureSingleExitChecker(python_ast.NodeVisitor):
             self.check_return_body(node, node.orelse)
 
     def check_return_body(self, node: python_ast.AST, node_list: List[Any]) -> None:
-        return_count = len([n for n in node_list if is_return_from_function(n)])
-        if return_count > 1:
+        return_position = None
+        for idx, n in enumerate(node_list):
+            if is_return_from_function(n):
+                if return_position is not None:
+                    raise StructureException(
+                        f'Too too many exit statements (return, raise or selfdestruct).',
+                        node
+                    )
+                return_position = idx
+        # Check for invalid code after returns.
+        if return_position is not None and return_position < len(node_list) - 1:
+            # is not last statement in body.
             raise StructureException(
-                f'Too too many exit statements (return, raise or selfdestruct).',
-                node
+                'Exit statement with succeeding code (that will not execute).',
+                node_list[return_position + 1]
             )
-        # Check for invalid code after returns.
-        last_node_pos = len(node_list) - 1
-        for idx, n in enumerate(node_list):
-            if is_return_from_function(n) and idx < last_node_pos:
-                # is not last statement in body.
-                raise StructureException(
-                    'Exit statement with succeeding code (that will not execute).',
-                    node_list[idx + 1]
-                )
 
 
 class UnmatchedReturnChecker(python_ast.NodeVisitor):
@@ -858,14 +901,17 @@ class UnmatchedReturnChecker(python_ast.NodeVisitor):
         if is_return_from_function(node):
             return True
         elif isinstance(node, list):
-            return any(self.return_check(stmt) for stmt in node)
+            # Scan statement lists in a loop so that only nested if
+            # statements need a recursive call.
+            for stmt in node:
+                if is_return_from_function(stmt):
+                    return True
+                elif isinstance(stmt, python_ast.If) and self.return_check(stmt):
+                    return True
+            return False
         elif isinstance(node, python_ast.If):
-            if_body_check = self.return_check(node.body)
-            else_body_check = self.return_check(node.orelse)
-            if if_body_check and else_body_check:  # both side need to match.
-                return True
-            else:
-                return False
+            # both side need to match.
+            return self.return_check(node.body) and self.return_check(node.orelse)
         return False
 
 
@@ -888,8 +934,56 @@ def annotate_ast(
     :param class_types: A mapping of class names to original class types.
     :return: The annotated and optmized AST.
     """
-    AnnotatingVisitor(source_code, class_types).visit(parsed_ast)
-    RewriteUnarySubVisitor().visit(parsed_ast)
+    if class_types is None:
+        class_types = {}
+
+    # Walk the tree in a flat pre-order traversal. Node ids follow the same
+    # depth-first order as a recursive visit, which ``ast.walk`` (breadth-first)
+    # would not preserve.
+    negations: List[Tuple[Any, Any, Optional[int], Optional[str]]] = []
+    node_id = 0
+    stack: List[Any] = [parsed_ast]
+    while stack:
+        node = stack.pop()
+
+        # Decorate every node in the AST with the original source code. This is
+        # necessary to facilitate error pretty-printing.
+        node.source_code = source_code
+        node.node_id = node_id
+        node_id += 1
+
+        # Decorate class definitions with their respective class types
+        if type(node) is python_ast.ClassDef:
+            node.class_type = class_types.get(node.name)
+
+        children: List[Any] = []
+        for field, value in python_ast.iter_fields(node):
+            if isinstance(value, list):
+                for i, item in enumerate(value):
+                    if isinstance(item, python_ast.AST):
+                        children.append(item)
+                        if (
+                            isinstance(item, python_ast.UnaryOp)
+                            and isinstance(item.op, python_ast.USub)
+                        ):
+                            negations.append((item, value, i, None))
+            elif isinstance(value, python_ast.AST):
+                children.append(value)
+                if isinstance(value, python_ast.UnaryOp) and isinstance(value.op, python_ast.USub):
+                    negations.append((value, node, None, field))
+        stack.extend(reversed(children))
+
+    # Substitute negative values for unary subtractions of numbers. Handling
+    # them in reverse pre-order folds nested negations from the inside out.
+    for unary, parent, index, parent_field in reversed(negations):
+        operand = unary.operand
+        if not isinstance(operand, python_ast.Num):
+            continue
+        operand.n = 0 - operand.n
+        if parent_field is None:
+            parent[index] = operand
+        else:
+            setattr(parent, parent_field, operand)
 
 
 # zero pad a bytearray according to the ABI spec. The last word
@@ -914,6 +1008,26 @@ def zero_pad(bytez_placeholder):
             )
 
 
+# zero pad a bytearray whose length is known at compile time, such as a
+# literal. The number of padding bytes is then a constant.
+def zero_pad_static(bytez_placeholder, bytez_length):
+    num_zero_bytes = ceil32(bytez_length) - bytez_length
+    if num_zero_bytes == 0:
+        return LLLnode.from_list(['pass'], annotation="Zero pad")
+    return LLLnode.from_list(
+        ['calldatacopy',
+            ['add', bytez_placeholder, 32 + bytez_length],
+            'calldatasize',
+            num_zero_bytes],
+        annotation="Zero pad",
+    )
+
+
+# Largest return value, in words, whose stack pushes are unrolled when it
+# lives at a placeholder position rather than a plain int
+MAX_UNROLLED_RETURN_WORDS = 8
+
+
 # Generate return code for stmt
 def make_return_stmt(stmt, context, begin_pos, _size, loop_memory_position=None):
     from vyper.parser.function_definitions.utils import (
@@ -921,24 +1035,31 @@ def make_return_stmt(stmt, context, begin_pos, _size, loop_memory_position=None)
     )
     _, nonreentrant_post = get_nonreentrant_lock(context.sig, context.global_ctx)
     if context.is_private:
-        if loop_memory_position is None:
-            loop_memory_position = context.new_placeholder(typ=BaseType('uint256'))
-
-        # Make label for stack push loop.
-        label_id = '_'.join([str(x) for x in (context.method_id, stmt.lineno, stmt.col_offset)])
-        exit_label = f'make_return_loop_exit_{label_id}'
-        start_label = f'make_return_loop_start_{label_id}'
+        # Memory placeholders are passed as literal nodes, whose position is
+        # as static as a plain int.
+        if isinstance(begin_pos, LLLnode) and isinstance(begin_pos.value, int) \
+                and not begin_pos.args and isinstance(_size, int) \
+                and _size <= MAX_UNROLLED_RETURN_WORDS * 32:
+            begin_pos = begin_pos.value
 
         # Push prepared data onto the stack,
         # in reverse order so it can be popped of in order.
         if isinstance(begin_pos, int) and isinstance(_size, int):
             # static values, unroll the mloads instead.
             mloads = [
-                ['mload', pos] for pos in range(begin_pos, _size, 32)
+                ['mload', pos] for pos in range(begin_pos + _size - 32, begin_pos - 1, -32)
             ]
             return ['seq_unchecked'] + mloads + nonreentrant_post + \
                 [['jump', ['mload', context.callback_ptr]]]
         else:
+            # Only the stack push loop needs a counter in memory.
+            if loop_memory_position is None:
+                loop_memory_position = context.new_placeholder(typ=BaseType('uint256'))
+
+            # Make label for stack push loop.
+            label_id = f'{context.method_id}_{stmt.lineno}_{stmt.col_offset}'
+            exit_label = f'make_return_loop_exit_{label_id}'
+            start_label = f'make_return_loop_start_{label_id}'
             mloads = [
                 'seq_unchecked',
                 ['mstore', loop_memory_position, _size],
@@ -968,6 +1089,7 @@ def make_return_stmt(stmt, context, begin_pos, _size, loop_memory_position=None)
 
 # Generate code for returning a tuple or struct.
 def gen_tuple_return(stmt, context, sub):
+    pos = getpos(stmt)
     # Is from a call expression.
     if sub.args and len(sub.args[0].args) > 0 and sub.args[0].args[0].value == 'call':
         # self-call to public.
@@ -980,27 +1102,36 @@ def gen_tuple_return(stmt, context, sub):
         mem_size = get_size_of_type(sub.typ) * 32
         # Add zero padder if bytes are present in output.
         zero_padder = ['pass']
-        byte_arrays = [
-            (i, x)
-            for i, x
-            in enumerate(sub.typ.tuple_members())
-            if isinstance(x, ByteArrayLike)
-        ]
-        if byte_arrays:
-            i, x = byte_arrays[-1]
+        # Only the last byte array needs padding, so scan from the end.
+        members = sub.typ.tuple_members()
+        for i in range(len(members) - 1, -1, -1):
+            if not isinstance(members[i], ByteArrayLike):
+                continue
             zero_padder = zero_pad(bytez_placeholder=[
                 'add',
                 mem_pos,
                 ['mload', mem_pos + i * 32]
             ])
+            break
         return LLLnode.from_list(['seq'] + [sub] + [zero_padder] + [
             make_return_stmt(stmt, context, mem_pos, mem_size)
-        ], typ=sub.typ, pos=getpos(stmt), valency=0)
+        ], typ=sub.typ, pos=pos, valency=0)
+
+    if not isinstance(context.return_type, TupleLike):
+        raise TypeMismatchException(
+            f'Trying to return {sub.typ} when expecting {context.return_type}', pos
+        )
+    items = context.return_type.tuple_items()
+    has_byte_arrays = any(isinstance(typ, ByteArrayLike) for _, typ in items)
 
     subs = []
     # Pre-allocate loop_memory_position if required for private function returning.
+    # Byte array data is packed past new_sub's slot, so the counter has to precede
+    # it. Static tuples get a placeholder of their full size instead, and
+    # make_return_stmt allocates the counter only if it does not unroll.
     loop_memory_position = (
-        context.new_placeholder(typ=BaseType('uint256')) if context.is_private else None
+        context.new_placeholder(typ=BaseType('uint256'))
+        if context.is_private and has_byte_arrays else None
     )
     # Allocate dynamic off set counter, to keep track of the total packed dynamic data size.
     dynamic_offset_counter_placeholder = context.new_placeholder(typ=BaseType('uint256'))
@@ -1010,12 +1141,14 @@ def gen_tuple_return(stmt, context, sub):
         annotation="dynamic_offset_counter"  # dynamic offset position counter.
     )
     new_sub = LLLnode.from_list(
-        context.new_placeholder(typ=BaseType('uint256')),
+        context.new_placeholder(
+            typ=BaseType('uint256') if has_byte_arrays else context.return_type
+        ),
         typ=context.return_type,
         location='memory',
         annotation='new_sub',
     )
-    left_token = LLLnode.from_list('_loc', typ=new_sub.typ, location="memory")
+    left_token = LLLnode('_loc', typ=new_sub.typ, location="memory")
 
     def get_dynamic_offset_value():
         # Get value of dynamic offset counter.
@@ -1030,26 +1163,24 @@ def gen_tuple_return(stmt, context, sub):
                 ['mload', dynamic_offset_counter]]
         ]
 
-    if not isinstance(context.return_type, TupleLike):
-        raise TypeMismatchException(
-            f'Trying to return {sub.typ} when expecting {context.return_type}', getpos(stmt)
-        )
-    items = context.return_type.tuple_items()
-
     dynamic_offset_start = 32 * len(items)  # The static list of args end.
 
     for i, (key, typ) in enumerate(items):
-        variable_offset = LLLnode.from_list(
-            ['add', 32 * i, left_token],
+        variable_offset = LLLnode(
+            'add',
+            [LLLnode(32 * i), left_token],
             typ=typ,
             annotation='variable_offset',
         )  # variable offset of destination
         if sub.typ.is_literal:
             arg = sub.args[i]
         else:
-            arg = add_variable_offset(parent=sub, key=key, pos=getpos(stmt))
+            arg = add_variable_offset(parent=sub, key=key, pos=pos)
 
-        if isinstance(typ, ByteArrayLike):
+        # Base types are the most common members, so they are checked first.
+        if isinstance(typ, BaseType):
+            subs.append(make_setter(variable_offset, arg, "memory", pos=pos))
+        elif isinstance(typ, ByteArrayLike):
             # Store offset pointer value.
             subs.append(['mstore', variable_offset, get_dynamic_offset_value()])
 
@@ -1060,11 +1191,8 @@ def gen_tuple_return(stmt, context, sub):
                 typ=typ,
                 annotation='dynamic_spot',
             )
-            subs.append(make_setter(dynamic_spot, arg, location="memory", pos=getpos(stmt)))
+            subs.append(make_setter(dynamic_spot, arg, location="memory", pos=pos))
             subs.append(increment_dynamic_offset(dynamic_spot))
-
-        elif isinstance(typ, BaseType):
-            subs.append(make_setter(variable_offset, arg, "memory", pos=getpos(stmt)))
         elif isinstance(typ, TupleLike):
             subs.append(gen_tuple_return(stmt, context, arg))
         else:
@@ -1072,6 +1200,12 @@ def gen_tuple_return(stmt, context, sub):
             # caught at an earlier type-checking stage.
             raise TypeMismatchException(f"Can't return type {arg.typ} as part of tuple", stmt)
 
+    # Without byte arrays nothing is packed past the static part.
+    if has_byte_arrays:
+        return_size = get_dynamic_offset_value()
+    else:
+        return_size = dynamic_offset_start
+
     setter = LLLnode.from_list(
         ['seq',
             ['mstore', dynamic_offset_counter, dynamic_offset_start],
@@ -1082,5 +1216,5 @@ def gen_tuple_return(stmt, context, sub):
     return LLLnode.from_list([
         'seq',
         setter,
-        make_return_stmt(stmt, context, new_sub, get_dynamic_offset_value(), loop_memory_position)
-    ], typ=None, pos=getpos(stmt), valency=0)
+        make_return_stmt(stmt, context, new_sub, return_size, loop_memory_position)
+    ], typ=None, pos=pos, valency=0)
@@ -38,6 +38,7 @@ from vyper.parser.parser_utils import (
     make_setter,
     unwrap_location,
     zero_pad,
+    zero_pad_static,
 )
 from vyper.types import (
     BaseType,
@@ -855,6 +856,12 @@ class Stmt(object):
             len_placeholder = self.context.new_placeholder(typ=BaseType('uint256'))
             bytez_placeholder = self.context.new_placeholder(typ=sub.typ)
 
+            # The padding of a literal is known at compile time.
+            if sub.typ.is_literal:
+                zero_padder = zero_pad_static(bytez_placeholder, sub.typ.maxlen)
+            else:
+                zero_padder = zero_pad(bytez_placeholder)
+
             if sub.location in ('storage', 'memory'):
                 return LLLnode.from_list([
                     'seq',
@@ -863,7 +870,7 @@ class Stmt(object):
                         sub,
                         pos=getpos(self.stmt)
                     ),
-                    zero_pad(bytez_placeholder),
+                    zero_padder,
                     ['mstore', len_placeholder, 32],
                     make_return_stmt(
                         self.stmt,
@@ -879,7 +886,6 @@ class Stmt(object):
         elif isinstance(sub.typ, ListType):
             sub_base_type = re.split(r'\(|\[', str(sub.typ.subtype))[0]
             ret_base_type = re.split(r'\(|\[', str(self.context.return_type.subtype))[0]
-            loop_memory_position = self.context.new_placeholder(typ=BaseType('uint256'))
             if sub_base_type != ret_base_type:
                 raise TypeMismatchException(
                     f"List return type {sub_base_type} does not match specified "
@@ -893,7 +899,6 @@ class Stmt(object):
                         self.context,
                         sub,
                         get_size_of_type(self.context.return_type) * 32,
-                        loop_memory_position=loop_memory_position,
                     ),
                     typ=None,
                     pos=getpos(self.stmt),
@@ -914,7 +919,6 @@ class Stmt(object):
                         self.context,
                         new_sub,
                         get_size_of_type(self.context.return_type) * 32,
-                        loop_memory_position=loop_memory_position,
                     )
                 ], typ=None, pos=getpos(self.stmt))
 